@@ -4,10 +4,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import re
 from collections import defaultdict
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import pronouncing
 from functools import lru_cache
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response
+import orjson
 import os
 
 # Concise logging for tracking analysis flow
@@ -32,132 +34,176 @@ class RhymeResponse(BaseModel):
     rhyme_colors: Dict[str, str]
     highlighted_lyrics: List[List[Dict[str, Any]]]
 
+# Matches words and trailing punctuation
+_TOKEN_RE = re.compile(r'(\w+)([.,!?;:]*)')
+
+# CMUdict's fixed vowel inventory, each carrying a stress marker (0, 1 or 2)
+_VOWEL_PHONEMES = frozenset(
+    v + stress
+    for v in ("AA", "AE", "AH", "AO", "AW", "AY", "EH", "ER", "EY", "IH", "IY", "OW", "OY", "UH", "UW")
+    for stress in "012"
+)
+
+# Mapping coda phonemes to acoustic families
+_CODA_CLASS = {
+    'M':'NAS','N':'NAS','NG':'NAS',
+    'S':'SIB','Z':'SIB','SH':'SIB','ZH':'SIB',
+    'P':'PLO','B':'PLO','T':'PLO','D':'PLO','K':'PLO','G':'PLO',
+    'F':'FRI','V':'FRI','TH':'FRI','DH':'FRI'
+}
+
+# Royal Palette: Deep Purple, Amethyst, Gold, Rose, Seafoam
+_COLOR_PALETTE = ("#8E44AD", "#2E86C1", "#D4AC0D", "#C0392B", "#16A085", "#D35400", "#273746")
+
+# Load CMUdict once at startup and read pronouncing's word -> phones table directly
+pronouncing.init_cmu()
+_CMU = pronouncing.lookup
+
+# Pronunciation helpers live at module level so their caches are shared across requests
+@lru_cache(maxsize=100_000)
+def _phones(word: str) -> str:
+    """Retrieves ARPAbet phonetic transcription for a (lowercase) word, cached for the process lifetime."""
+    pron = _CMU.get(word)
+    return pron[0] if pron else ''
+
+@lru_cache(maxsize=20000)
+def get_syllables(word: str) -> Tuple[Tuple[str, ...], ...]:
+    """Groups phonemes into syllables based on vowel stress markers, e.g. (("D", "R", "IY1", "M"),)."""
+    phonetic = _phones(word)
+    if not phonetic: return ()
+    syllables, current = [], []
+    for p in phonetic.split():
+        current.append(p)
+        if p in _VOWEL_PHONEMES: # Vowel found
+            syllables.append(tuple(current))
+            current = []
+    if current: # Attach trailing consonants
+        if syllables: syllables[-1] += tuple(current)
+        else: syllables.append(tuple(current))
+    return tuple(syllables)
+
+@lru_cache(maxsize=20000)
+def get_rhyme_signature(phonemes: Tuple[str, ...]) -> str:
+    """
+    Creates a 'Slant Signature'. 
+    Matches the primary vowel and maps trailing consonants to 'Families' 
+    (e.g., 'M' and 'N' both become 'NASAL') so near-rhymes are captured.
+    """
+    v_idx = next((i for i, p in enumerate(phonemes) if p in _VOWEL_PHONEMES), -1)
+    if v_idx == -1: return ' '.join(phonemes)
+    
+    vowel = phonemes[v_idx]
+    # Only the first two coda consonants decide the rhyme; later ones (e.g. plural -s) are dropped
+    coda = phonemes[v_idx + 1:v_idx + 3]
+    return f"{vowel}-{''.join([_CODA_CLASS.get(p, p) for p in coda])}"
+
 class Song:
     def __init__(self, lyrics: str):
         self.lyrics = lyrics
         self.blacklist = {"a", "the", "an", "and", "or", "of", "to", "in", "it", "is"}
-        self.word_to_rhyme_group = {}
         
         # Tokenize preserves original casing for display while lowercasing for analysis
         self.tokenized_lyrics = self.tokenize_lyrics(self.lyrics)
+        # Per-word phonetics computed once and shared by every later phase
+        self._precompute_words()
         # Detect rhymes based on phonetic syllable signatures
-        self.rhyme_groups = self.detect_rhymes(self.tokenized_lyrics)
+        self.rhyme_groups = self.detect_rhymes()
 
     def tokenize_lyrics(self, lyrics: str) -> List[List[Dict[str, str]]]:
         """Splits lyrics into lines and words while preserving punctuation and original casing."""
-        lines = lyrics.split('\n')
-        tokenized = []
-        for line in lines:
-            # Matches words and trailing punctuation
-            tokens = re.findall(r'\b\w+\b[.,!?;:]*', line)
-            line_data = []
-            for t in tokens:
-                match = re.match(r'(\w+)([.,!?;:]*)', t)
-                if match:
-                    line_data.append({
-                        "original": match.group(1), # For display
-                        "clean": match.group(1).lower(), # For analysis
-                        "punct": match.group(2)
-                    })
-            tokenized.append(line_data)
-        return tokenized
-
-    @lru_cache(maxsize=10000)
-    def get_phonetic_code(self, word: str) -> str:
-        """Retrieves ARPAbet phonetic transcription for a word."""
-        pron = pronouncing.phones_for_word(word)
-        return pron[0] if pron else ''
-
-    def get_syllables(self, word: str) -> List[str]:
-        """Groups phonemes into syllables based on vowel stress markers."""
-        phonetic = self.get_phonetic_code(word)
-        if not phonetic: return []
-        syllables, current = [], []
-        for p in phonetic.split():
-            current.append(p)
-            if any(s in p for s in ['0', '1', '2']): # Vowel found
-                syllables.append(' '.join(current))
-                current = []
-        if current: # Attach trailing consonants
-            if syllables: syllables[-1] += ' ' + ' '.join(current)
-            else: syllables.append(' '.join(current))
-        return syllables
+        return [
+            [
+                {
+                    "original": m.group(1), # For display
+                    "clean": m.group(1).lower(), # For analysis
+                    "punct": m.group(2)
+                }
+                for m in _TOKEN_RE.finditer(line)
+            ]
+            for line in lyrics.split('\n')
+        ]
+
+    def _precompute_words(self):
+        """Builds syllable, signature and split lookups for each unique word in first-seen order."""
+        # Stopwords and single letters can never rhyme, so they never reach pronouncing
+        tokens = [t for line in self.tokenized_lyrics for t in line
+                  if t["clean"] not in self.blacklist and len(t["clean"]) > 1]
+        vocab = list(dict.fromkeys(t["clean"] for t in tokens))
+        self._syllables = {w: get_syllables(w) for w in vocab}
+        self._signatures = {w: [get_rhyme_signature(s) for s in syls] for w, syls in self._syllables.items()}
+        # Per-word list of group signatures by syllable index (None where it doesn't rhyme); filled by detect_rhymes
+        self._word_groups: Dict[str, List[Optional[str]]] = {w: [None] * len(syls) for w, syls in self._syllables.items()}
+        # Keyed by original casing since the splits are what gets displayed
+        self._splits = {o: self.split_word_by_syllables(o) for o in dict.fromkeys(t["original"] for t in tokens)}
 
     def split_word_by_syllables(self, word: str) -> List[str]:
         """Calculates rough character spans for syllables to colorize the word parts."""
-        syl_count = len(self.get_syllables(word.lower()))
+        syl_count = len(get_syllables(word.lower()))
         if syl_count <= 1: return [word]
         step = len(word) / syl_count
         return [word[int(i*step):int((i+1)*step) if i<syl_count-1 else len(word)] for i in range(syl_count)]
 
-    def get_rhyme_signature(self, syllable_phonemes: str) -> str:
-        """
-        Creates a 'Slant Signature'. 
-        Matches the primary vowel and maps trailing consonants to 'Families' 
-        (e.g., 'M' and 'N' both become 'NASAL') so near-rhymes are captured.
-        """
-        phonemes = syllable_phonemes.split()
-        v_idx = next((i for i, p in enumerate(phonemes) if any(c.isdigit() for c in p)), -1)
-        if v_idx == -1: return syllable_phonemes
-        
-        vowel = phonemes[v_idx]
-        coda = phonemes[v_idx + 1:]
-        # Mapping phonemes to acoustic families
-        mapping = {
-            'M':'NAS','N':'NAS','NG':'NAS',
-            'S':'SIB','Z':'SIB','SH':'SIB','ZH':'SIB',
-            'P':'PLO','B':'PLO','T':'PLO','D':'PLO','K':'PLO','G':'PLO',
-            'F':'FRI','V':'FRI','TH':'FRI','DH':'FRI'
-        }
-        return f"{vowel}-{''.join([mapping.get(p, p) for p in coda])}"
-
-    def detect_rhymes(self, tokenized_lyrics: List[List[Dict[str, str]]]) -> Dict[str, List[tuple]]:
+    def detect_rhymes(self) -> Dict[str, List[tuple]]:
         """Scans all words to group matching syllable signatures."""
+        # Single pass: syllables rhyme iff signatures match, so bucket by signature.
+        # Each (word, idx) is visited once, so buckets stay duplicate-free in first-seen order.
         potential = defaultdict(list)
-        for line in tokenized_lyrics:
-            for token in line:
-                word = token["clean"]
-                if word in self.blacklist or len(word) <= 1: continue
-                for idx, syl in enumerate(self.get_syllables(word)):
-                    sig = self.get_rhyme_signature(syl)
-                    potential[sig].append((word, idx))
-        
+        for word, sigs in self._signatures.items():
+            for idx, sig in enumerate(sigs):
+                potential[sig].append((word, idx))
+
         # Filter groups to only include those appearing in multiple words
-        filtered = {k: list(set(v)) for k, v in potential.items() if len(set(w for w, _ in v)) >= 2}
+        filtered = {k: v for k, v in potential.items() if len({w for w, _ in v}) >= 2}
         for sig, matches in filtered.items():
             for word, idx in matches:
-                self.word_to_rhyme_group[(word, idx)] = sig
+                self._word_groups[word][idx] = sig
         return filtered
 
     def analyze(self) -> dict:
         """Constructs the final response with majestic colors and preserved casing."""
-        # Royal Palette: Deep Purple, Amethyst, Gold, Rose, Seafoam
-        palette = ["#8E44AD", "#2E86C1", "#D4AC0D", "#C0392B", "#16A085", "#D35400", "#273746"]
-        colors = {sig: palette[i % len(palette)] for i, sig in enumerate(self.rhyme_groups.keys())}
+        colors = {sig: _COLOR_PALETTE[i % len(_COLOR_PALETTE)] for i, sig in enumerate(self.rhyme_groups.keys())}
         
+        # Resolve each word's per-syllable colors once, then emit every token in a single pass
+        word_colors = {w: [colors.get(g) for g in groups] for w, groups in self._word_groups.items()}
         highlighted = []
         for line in self.tokenized_lyrics:
             h_line = []
             for token in line:
-                original, clean, punct = token["original"], token["clean"], token["punct"]
-                syl_phonemes = self.get_syllables(clean)
-                syl_strings = self.split_word_by_syllables(original)
-                
-                parts = []
-                for i in range(len(syl_phonemes)):
-                    color = colors.get(self.word_to_rhyme_group.get((clean, i)))
-                    parts.append({
-                        "text": syl_strings[i] if i < len(syl_strings) else "",
-                        "color": color
-                    })
-                h_line.append({"word": original, "punct": punct, "syllable_parts": parts})
+                original = token["original"]
+                syl_colors = word_colors.get(token["clean"])
+                if syl_colors is None: # Stopword or single letter: shown as-is, never colored
+                    parts = [{"text": original, "color": None}]
+                else:
+                    splits = self._splits[original]
+                    parts = [
+                        {"text": splits[i] if i < len(splits) else "", "color": color}
+                        for i, color in enumerate(syl_colors)
+                    ]
+                h_line.append({"word": original, "punct": token["punct"], "syllable_parts": parts})
             highlighted.append(h_line)
-            
+
         return {"rhyme_groups": {}, "rhyme_colors": colors, "highlighted_lyrics": highlighted}
 
+# Serialized output is ~15x the lyrics size, so only song-sized inputs are cached:
+# 256 entries x 10k chars keeps the cache around 40 MB at worst
+_ANALYSIS_CACHE_MAX_CHARS = 10_000
+
+@lru_cache(maxsize=256)
+def _analyze_cached(lyrics: str) -> bytes:
+    """Memoizes serialized analyses so re-submitted lyrics skip both the pipeline and encoding."""
+    return orjson.dumps(Song(lyrics).analyze())
+
+def _analyze_json(lyrics: str) -> bytes:
+    if len(lyrics) > _ANALYSIS_CACHE_MAX_CHARS:
+        return orjson.dumps(Song(lyrics).analyze())
+    return _analyze_cached(lyrics)
+
+# Plain def so FastAPI runs the CPU-bound analysis in its threadpool instead of on the event loop
 @app.post("/analyze", response_model=RhymeResponse)
-async def analyze_lyrics(request: LyricsRequest):
-    return Song(request.lyrics).analyze()
+def analyze_lyrics(request: LyricsRequest):
+    # Returned as a response directly: the payload holds one dict per syllable, so skip
+    # re-validating it through RhymeResponse (still used for the OpenAPI schema)
+    return Response(content=_analyze_json(request.lyrics), media_type="application/json")
 
 
 
@@ -1,46 +1,216 @@
+import argparse
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def get_lyrics(artist, track):
-    url = "https://lrclib.net/api/get"
-    
+logger = logging.getLogger(__name__)
+
+_API_URL = "https://lrclib.net/api/get"
+# (connect, read) seconds; 3.05 sits just past the 3 s TCP SYN retransmit window
+_TIMEOUT = (3.05, 10)
+
+# One shared session so the TCP/TLS connection to lrclib is kept alive between lookups
+_SESSION = requests.Session()
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=('GET',),
+    respect_retry_after_header=True,
+    raise_on_status=False, # Hand the final 429/5xx back so get_lyrics reports the status code
+)
+_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRY))
+_SESSION.headers.update({
+    'Accept': 'application/json',
+    'Connection': 'keep-alive',
+    'User-Agent': 'lyric-rhyme-analyzer',
+})
+atexit.register(_SESSION.close)
+
+# Successful lookups persist across runs so repeated tracks skip the network entirely
+_DISK_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'lrclib', 'lyrics.sqlite3')
+_DISK_TTL = 7 * 86400
+_disk_lock = threading.Lock()
+_disk_conn = None
+
+_STATUS_MSG = {404: "Error: Lyrics not found in the database."}
+
+class LyricsError(Exception):
+    """Raised when a track has no usable lyrics (not found, bad status, network error); never cached."""
+
+def _disk():
+    global _disk_conn
+    if _disk_conn is None:
+        os.makedirs(os.path.dirname(_DISK_PATH), exist_ok=True)
+        _disk_conn = sqlite3.connect(_DISK_PATH, check_same_thread=False)
+        _disk_conn.execute(
+            'CREATE TABLE IF NOT EXISTS tracks (artist TEXT, track TEXT, track_name TEXT, '
+            'artist_name TEXT, lyrics TEXT, fetched REAL, PRIMARY KEY (artist, track))'
+        )
+        atexit.register(_disk_conn.close)
+    return _disk_conn
+
+# The disk layer is best-effort: an unusable cache location counts as a miss, never a failed lookup
+def _disk_get(artist, track):
+    try:
+        with _disk_lock:
+            row = _disk().execute(
+                'SELECT track_name, artist_name, lyrics FROM tracks '
+                'WHERE artist = ? AND track = ? AND fetched > ?',
+                (artist, track, time.time() - _DISK_TTL),
+            ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.debug("lyrics disk cache read failed: %s", e)
+        return None
+    return row
+
+def _disk_set(artist, track, found):
+    try:
+        with _disk_lock, _disk() as conn:
+            conn.execute('INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?)', (artist, track, *found, time.time()))
+    except (sqlite3.Error, OSError) as e:
+        logger.debug("lyrics disk cache write failed: %s", e)
+
+def _fetch_lyrics(artist, track, timeout):
     params = {
         'artist_name': artist,
         'track_name': track
     }
     
-    try:
-        response = requests.get(url, params=params)
-        
-        if response.status_code == 200:
+    response = _SESSION.get(_API_URL, params=params, timeout=timeout)
+    
+    if response.status_code == 200:
+        try:
+            data = orjson.loads(response.content)
+        except orjson.JSONDecodeError: # e.g. non-UTF-8 body, which requests can still decode
             data = response.json()
-            
-            print(f"--- Lyrics for {data.get('trackName')} by {data.get('artistName')} ---")
-            
-            lyrics = data.get('plainLyrics')
-            
-            if lyrics:
-                return lyrics
-            else:
-                return "Lyrics found, but no plain text version available."
+        if not isinstance(data, dict):
+            raise LyricsError("Error: Unexpected response from lrclib.")
+        
+        logger.debug("fetched %s by %s", data.get('trackName'), data.get('artistName'))
         
-        elif response.status_code == 404:
-            return "Error: Lyrics not found in the database."
+        lyrics = data.get('plainLyrics')
+        
+        if lyrics:
+            return (data.get('trackName'), data.get('artistName'), lyrics)
         else:
-            return f"Error: Received status code {response.status_code}"
+            raise LyricsError("Lyrics found, but no plain text version available.")
+    
+    raise LyricsError(_STATUS_MSG.get(response.status_code) or f"Error: Received status code {response.status_code}")
+
+# In-memory memo of successful lookups (most recent last) and lookups currently in progress,
+# so repeats skip the disk and concurrent callers for the same track share one request
+_MEMO_SIZE = 1024
+_memo = OrderedDict()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _wait_budget(timeout):
+    # Worst case for one lookup: every attempt hits its full timeout, plus the backoff sleeps between them
+    if timeout is None:
+        return None
+    per_attempt = sum(timeout) if isinstance(timeout, tuple) else timeout
+    backoff = sum(_RETRY.backoff_factor * 2 ** i for i in range(_RETRY.total))
+    return per_attempt * (_RETRY.total + 1) + backoff
 
-    except Exception as e:
-        return f"An error occurred: {e}"
+def _load_lyrics(artist, track, timeout):
+    # Returns (track_name, artist_name, lyrics) as reported by lrclib.
+    # Order is memory -> in-flight -> disk -> HTTP; failures are never memoized, so they are retried
+    key = (artist, track)
+    with _inflight_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        # Wait no longer than this caller's own lookup could take, and raise a fresh error per
+        # waiter rather than sharing (and mutating the traceback of) the leader's exception
+        try:
+            return future.result(timeout=_wait_budget(timeout))
+        except FutureTimeout as e:
+            raise LyricsError("An error occurred: timed out waiting for an in-progress lookup") from e
+        except LyricsError as e:
+            raise LyricsError(str(e)) from e
+        except requests.RequestException as e:
+            raise LyricsError(f"An error occurred: {e}") from e
 
-def main():
-    # artist_input = "martin garrix"
-    # track_input = "animals"
+    try:
+        found = _disk_get(artist, track)
+        if found is None:
+            found = _fetch_lyrics(artist, track, timeout)
+            _disk_set(artist, track, found)
+    except BaseException as e:
+        with _inflight_lock:
+            del _inflight[key]
+        future.set_exception(e)
+        raise
+    with _inflight_lock:
+        del _inflight[key]
+        _memo[key] = found
+        if len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    future.set_result(found)
+    return found
+
+def _normalize(s):
+    # lrclib matches case-insensitively, so " Coldplay " and "coldplay" share one cache entry
+    return ' '.join(s.casefold().split())
 
-    artist_input = "coldplay"
-    track_input = "sparks"
-    track_input = "such a rush"
+def get_track(artist, track, timeout=_TIMEOUT):
+    try:
+        track_name, artist_name, lyrics = _load_lyrics(_normalize(artist), _normalize(track), timeout)
+    # Transient connect/read failures were already retried by the session's adapter
+    except requests.RequestException as e:
+        raise LyricsError(f"An error occurred: {e}") from e
+    return {'track': track_name, 'artist': artist_name, 'lyrics': lyrics}
 
-    song_lyrics = get_lyrics(artist_input, track_input)
-    print(song_lyrics)
+def get_lyrics(artist, track, timeout=_TIMEOUT):
+    # Lyrics on success, otherwise the error message
+    try:
+        return get_track(artist, track, timeout)['lyrics']
+    except LyricsError as e:
+        return str(e)
+
+def get_lyrics_many(pairs, max_workers=8, timeout=_TIMEOUT):
+    # Lookups are network-bound, so run them side by side over the shared session's pool
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = {ex.submit(get_lyrics, artist, track, timeout): (artist, track) for artist, track in pairs}
+        return {futures[f]: f.result() for f in as_completed(futures)}
+
+def _prewarm():
+    # Opens the pooled connection (DNS + TCP + TLS) ahead of the first real lookup
+    try:
+        _SESSION.head(_API_URL, timeout=_TIMEOUT)
+    except requests.RequestException:
+        pass # Best effort: get_lyrics connects on its own if this failed
+
+if os.environ.get('LRCLIB_PREWARM') == '1':
+    threading.Thread(target=_prewarm, daemon=True).start()
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Fetch plain lyrics for a track from LRCLIB.")
+    parser.add_argument('--artist', required=True)
+    parser.add_argument('--track', required=True)
+    args = parser.parse_args()
+
+    try:
+        found = get_track(args.artist, args.track)
+    except LyricsError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"--- Lyrics for {found['track']} by {found['artist']} ---")
+    print(found['lyrics'])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    _cli()
\ No newline at end of file